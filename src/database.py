@@ -1,6 +1,7 @@
 # src/database.py
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime
-from databases import Database
+from sqlalchemy import event, MetaData, Table, Column, Index, Integer, String, Float, DateTime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 from dotenv import load_dotenv
 from datetime import datetime
@@ -8,7 +9,33 @@ from datetime import datetime
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./system_health.db")
-database = Database(DATABASE_URL)
+
+# Plain sqlite URLs (as in .env) need the async driver spelled out
+if DATABASE_URL.startswith("sqlite://"):
+    DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+engine = create_async_engine(
+    DATABASE_URL,
+    # aiosqlite defaults to NullPool, which rejects the sizing arguments below
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    echo=False
+)
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # metrics_history is append-only; WAL keeps writers from blocking
+        # range reads and avoids an fsync per commit
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 metadata = MetaData()
 
 metadata_table = Table(
@@ -19,6 +46,7 @@ metadata_table = Table(
     Column("environment", String(50)),
     Column("location", String(100)),
 )
+Index("ix_metadata_name", metadata_table.c.name, unique=True)
 users_table = Table(
     "users",
     metadata,
@@ -40,6 +68,7 @@ alerts_table = Table(
     Column("current_value", Float),
     Column("status", String(20))
 )
+Index("ix_alerts_status_ts", alerts_table.c.status, alerts_table.c.timestamp)
 
 metrics_history_table = Table(
     "metrics_history",
@@ -49,4 +78,5 @@ metrics_history_table = Table(
     Column("cpu_percent", Float),
     Column("memory_percent", Float),
     Column("disk_percent", Float)
-)
\ No newline at end of file
+)
+Index("ix_metrics_history_ts", metrics_history_table.c.timestamp)
@@ -1,17 +1,24 @@
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import APIKeyHeader
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import psutil
 import asyncio
-import requests
-from .database import database, metadata_table, alerts_table, metrics_history_table,users_table
-from sqlalchemy import create_engine, select, and_,Table, Column, Integer, String, DateTime
+import time
+import httpx
+import orjson
+from .database import engine, AsyncSessionLocal, metadata as db_metadata, metadata_table, alerts_table, metrics_history_table,users_table
+from sqlalchemy import select, func, and_,Table, Column, Integer, String, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from pydantic import BaseModel, validator,EmailStr
 import os
 from dotenv import load_dotenv
 import uuid
+import hmac
+import hashlib
 from passlib.context import CryptContext
 
 load_dotenv()
@@ -64,7 +71,10 @@ class AlertResponse(BaseModel):
 app = FastAPI(
     title="System Health Monitor",
     description="A tool for monitoring system health metrics and sending alerts",
-    version="1.0.0"
+    version="1.0.0",
+    # Handlers return datetimes as-is; jsonable_encoder still runs on plain
+    # return values, orjson only replaces the final json.dumps
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -76,7 +86,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=10, deprecated="auto")
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -84,26 +94,93 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def sign_api_key(key_id: str) -> str:
+    return hmac.new(API_KEY_SECRET.encode(), key_id.encode(), hashlib.sha256).hexdigest()
+
 def generate_api_key() -> str:
-    return str(uuid.uuid4())
+    key_id = str(uuid.uuid4())
+    if not API_KEY_SECRET:
+        return key_id
+    return f"{key_id}.{sign_api_key(key_id)}"
+
+def is_signed_api_key(api_key: str) -> bool:
+    """Check an API key's HMAC signature without touching the database"""
+    if not API_KEY_SECRET:
+        return False
+    key_id, _, signature = api_key.partition(".")
+    # Compare bytes: compare_digest rejects non-ASCII str, and headers may carry any latin-1
+    return bool(signature) and hmac.compare_digest(
+        signature.encode(), sign_api_key(key_id).encode()
+    )
 
 # Configuration
 
 CPU_THRESHOLD = float(os.getenv("CPU_THRESHOLD", "80"))
 MEMORY_THRESHOLD = float(os.getenv("MEMORY_THRESHOLD", "85"))
 DISK_THRESHOLD = float(os.getenv("DISK_THRESHOLD", "90"))
+# (alert metric_type, threshold, key in get_system_metrics())
+_CHECKS = (
+    ("CPU", CPU_THRESHOLD, "cpu"),
+    ("Memory", MEMORY_THRESHOLD, "memory"),
+    ("Disk", DISK_THRESHOLD, "disk")
+)
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+# When set, new API keys are HMAC-signed and verified without a DB lookup
+API_KEY_SECRET = os.getenv("API_KEY_SECRET")
+
+# Dialect-specific INSERT supporting ON CONFLICT upserts
+upsert_insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
 
 # Authentication
 api_key_header = APIKeyHeader(name="X-API-Key")
 
+# API key lookups mapped to (expires_at, user_id or None for unknown keys);
+# keys never change once issued, unknown keys are only remembered briefly
+_API_KEY_CACHE: Dict[str, tuple] = {}
+_CACHE_TTL = 60
+_NEGATIVE_CACHE_TTL = 5
+_API_KEY_CACHE_MAX = 10000
+# In-flight lookups, so concurrent misses for the same key share one query
+_api_key_lookups: Dict[str, asyncio.Task] = {}
+
+def _cache_api_key(api_key: str, user_id: Optional[int]):
+    now = time.monotonic()
+    if len(_API_KEY_CACHE) >= _API_KEY_CACHE_MAX:
+        for key, (expires_at, _) in list(_API_KEY_CACHE.items()):
+            if expires_at <= now:
+                del _API_KEY_CACHE[key]
+        if len(_API_KEY_CACHE) >= _API_KEY_CACHE_MAX:
+            return
+    ttl = _CACHE_TTL if user_id is not None else _NEGATIVE_CACHE_TTL
+    _API_KEY_CACHE[api_key] = (now + ttl, user_id)
+
+async def _lookup_api_key(api_key: str) -> Optional[int]:
+    query = users_table.select().where(users_table.c.api_key == api_key)
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(query)).first()
+    user_id = user.id if user else None
+    _cache_api_key(api_key, user_id)
+    return user_id
+
 # verify_api_key function
 async def verify_api_key(api_key: str = Depends(api_key_header)):
     """Verify the API key against registered users"""
-    query = users_table.select().where(users_table.c.api_key == api_key)
-    user = await database.fetch_one(query)
-    
-    if not user:
+    if is_signed_api_key(api_key):
+        return api_key
+
+    cached = _API_KEY_CACHE.get(api_key)
+    if cached and time.monotonic() < cached[0]:
+        user_id = cached[1]
+    else:
+        lookup = _api_key_lookups.get(api_key)
+        if lookup is None:
+            lookup = asyncio.create_task(_lookup_api_key(api_key))
+            _api_key_lookups[api_key] = lookup
+            lookup.add_done_callback(lambda _: _api_key_lookups.pop(api_key, None))
+        # Shielded so one cancelled request doesn't cancel the shared lookup
+        user_id = await asyncio.shield(lookup)
+
+    if user_id is None:
         raise HTTPException(
             status_code=401,
             detail="Invalid API key"
@@ -116,19 +193,63 @@ async def startup():
     """
     Initialize database and start background monitoring on startup
     """
-    engine = create_engine(str(database.url))
-    metadata_table.create(engine, checkfirst=True)
-    alerts_table.create(engine, checkfirst=True)
-    metrics_history_table.create(engine, checkfirst=True)
-    await database.connect()
+    async with engine.begin() as conn:
+        await conn.run_sync(db_metadata.create_all)
+        # ix_metadata_name is unique; databases from before it existed may hold
+        # several rows per name, so keep only the newest (last write wins)
+        deduped = await conn.execute(
+            metadata_table.delete().where(
+                metadata_table.c.name.is_not(None),
+                metadata_table.c.id.not_in(
+                    select(func.max(metadata_table.c.id)).group_by(metadata_table.c.name)
+                )
+            )
+        )
+        if deduped.rowcount:
+            print(f"Removed {deduped.rowcount} duplicate metadata rows")
+        # Tables that already existed don't get indexes added by create_all()
+        for table in db_metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
+    # One long-lived client so Slack posts share a keep-alive HTTP/2 connection
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=4, max_connections=8)
+    )
+    # Prime psutil so the first non-blocking sample measures a real interval
+    psutil.cpu_percent(interval=None)
+    asyncio.create_task(_cpu_sampler())
     asyncio.create_task(check_system_health())
 
 @app.on_event("shutdown")
 async def shutdown():
     """
-    Disconnect from database on shutdown
-    """
-    await database.disconnect()
+    Flush buffered metrics and dispose of the database connection pool on shutdown
+    """
+    await flush_historical_metrics()
+    await engine.dispose()
+    await app.state.http.aclose()
+
+# Slack message layout; only the per-alert slots are filled in on each send
+_SLACK_TEMPLATE = {
+    "attachments": [
+        {
+            "color": None,
+            "title": None,
+            "fields": [
+                {"title": "Metric", "value": None, "short": True},
+                {"title": "Current Value", "value": None, "short": True},
+                {"title": "Threshold", "value": None, "short": True},
+                {"title": "Status", "value": None, "short": True}
+            ],
+            "footer": "System Health Monitor",
+            "ts": None
+        }
+    ]
+}
+_SLACK_ATTACHMENT = _SLACK_TEMPLATE["attachments"][0]
+_SLACK_FIELDS = _SLACK_ATTACHMENT["fields"]
 
 # Notification function
 async def send_slack_alert(alert_data: dict):
@@ -140,100 +261,120 @@ async def send_slack_alert(alert_data: dict):
         return
     
     try:
-        # Create a formatted Slack message
-        color = "#ff0000" if alert_data['status'] == "active" else "#36a64f"
-        
-        message = {
-            "attachments": [
-                {
-                    "color": color,
-                    "title": f"System Alert: {alert_data['metric_type']} Usage High",
-                    "fields": [
-                        {
-                            "title": "Metric",
-                            "value": alert_data['metric_type'],
-                            "short": True
-                        },
-                        {
-                            "title": "Current Value",
-                            "value": f"{alert_data['current_value']}%",
-                            "short": True
-                        },
-                        {
-                            "title": "Threshold",
-                            "value": f"{alert_data['threshold']}%",
-                            "short": True
-                        },
-                        {
-                            "title": "Status",
-                            "value": alert_data['status'],
-                            "short": True
-                        }
-                    ],
-                    "footer": "System Health Monitor",
-                    "ts": int(datetime.now().timestamp())
-                }
-            ]
-        }
+        # Fill the shared template and serialize it straight away; there is
+        # no await in between, so concurrent sends can't interleave here
+        _SLACK_ATTACHMENT["color"] = "#ff0000" if alert_data['status'] == "active" else "#36a64f"
+        _SLACK_ATTACHMENT["title"] = f"System Alert: {alert_data['metric_type']} Usage High"
+        _SLACK_ATTACHMENT["ts"] = int(time.time())
+        _SLACK_FIELDS[0]["value"] = alert_data['metric_type']
+        _SLACK_FIELDS[1]["value"] = f"{alert_data['current_value']}%"
+        _SLACK_FIELDS[2]["value"] = f"{alert_data['threshold']}%"
+        _SLACK_FIELDS[3]["value"] = alert_data['status']
+        message = orjson.dumps(_SLACK_TEMPLATE)
         
-        # Send to Slack with retry logic
+        # Send to Slack with exponential backoff, honouring rate limits
         for attempt in range(3):  # Try 3 times
             try:
-                response = requests.post(
+                response = await app.state.http.post(
                     SLACK_WEBHOOK_URL,
-                    json=message,
-                    timeout=5
+                    content=message,
+                    headers={"Content-Type": "application/json"}
                 )
+                if response.status_code == 429 and attempt < 2:
+                    retry_after = response.headers.get("Retry-After")
+                    await asyncio.sleep(float(retry_after) if retry_after else 0.2 * 2 ** attempt)
+                    continue
                 response.raise_for_status()
                 print(f"Slack alert sent successfully for {alert_data['metric_type']}")
                 break
-            except Exception as e:
+            except httpx.HTTPError as e:
                 if attempt == 2:  # Last attempt
                     raise e
-                await asyncio.sleep(1)  # Wait before retry
+                await asyncio.sleep(0.2 * 2 ** attempt)  # Wait before retry
         
     except Exception as e:
         print(f"Error sending Slack alert: {str(e)}")
 
 # Utility functions
+# Most recent CPU utilisation, refreshed by _cpu_sampler; readers wait for
+# the first real sample rather than reporting 0.0
+_latest_cpu = 0.0
+_cpu_sampled = asyncio.Event()
+
+async def _cpu_sampler():
+    """
+    Background task that samples CPU usage once a second without blocking
+    """
+    global _latest_cpu
+    while True:
+        # Sleep first so every reading covers a full second since the last call
+        await asyncio.sleep(1)
+        _latest_cpu = psutil.cpu_percent(interval=None)
+        _cpu_sampled.set()
+
 async def get_system_metrics():
     """
     Collect current system metrics
     """
+    await _cpu_sampled.wait()
     try:
+        vm = psutil.virtual_memory()
+        du = psutil.disk_usage('/')
         return {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": datetime.utcnow(),
             "cpu": {
-                "percent": psutil.cpu_percent(interval=1),
+                "percent": _latest_cpu,
                 "cores": psutil.cpu_count()
             },
             "memory": {
-                "total": psutil.virtual_memory().total,
-                "used": psutil.virtual_memory().used,
-                "percent": psutil.virtual_memory().percent
+                "total": vm.total,
+                "used": vm.used,
+                "percent": vm.percent
             },
             "disk": {
-                "total": psutil.disk_usage('/').total,
-                "used": psutil.disk_usage('/').used,
-                "percent": psutil.disk_usage('/').percent
+                "total": du.total,
+                "used": du.used,
+                "percent": du.percent
             }
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error collecting system metrics: {str(e)}")
 
+# Bounds concurrent Slack posts; tasks are kept referenced until they finish
+_slack_sem = asyncio.Semaphore(4)
+_slack_tasks = set()
+
+async def _fire_slack_alert(alert_data: dict):
+    async with _slack_sem:
+        await send_slack_alert(alert_data)
+
 async def create_alert(metric_type: str, threshold: float, current_value: float):
     """
-    Create and store a new alert, send Slack notification
+    Create and store a new alert, send Slack notification.
+    Skipped while an alert for the same metric is still active.
     """
     try:
+        existing_query = alerts_table.select().where(
+            and_(
+                alerts_table.c.metric_type == metric_type,
+                alerts_table.c.status == "active"
+            )
+        ).limit(1)
+        now = datetime.utcnow()
         query = alerts_table.insert().values(
-            timestamp=datetime.now(),
+            timestamp=now,
             metric_type=metric_type,
             threshold=threshold,
             current_value=current_value,
             status="active"
         )
-        alert_id = await database.execute(query)
+        async with AsyncSessionLocal() as session:
+            existing = (await session.execute(existing_query)).first()
+            if existing:
+                return
+            result = await session.execute(query)
+            await session.commit()
+        alert_id = result.inserted_primary_key[0]
         
         alert_data = {
             "id": alert_id,
@@ -241,52 +382,74 @@ async def create_alert(metric_type: str, threshold: float, current_value: float)
             "threshold": threshold,
             "current_value": current_value,
             "status": "active",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now
         }
         
-        # Send Slack notification
-        await send_slack_alert(alert_data)
+        # Send Slack notification without holding up the health check
+        task = asyncio.create_task(_fire_slack_alert(alert_data))
+        _slack_tasks.add(task)
+        task.add_done_callback(_slack_tasks.discard)
         
         print(f"ALERT: {metric_type} usage at {current_value}% (threshold: {threshold}%)")
         
     except Exception as e:
         print(f"Error creating alert: {str(e)}")
 
+# Samples waiting to be written to metrics_history in a single batch
+# (get_metrics_history also serves these, so recent samples are never missing)
+_metrics_buffer: List[Dict] = []
+_flush_lock = asyncio.Lock()
+_BUFFER_MAX = 10
+
 async def store_historical_metrics(metrics: Dict):
     """
-    Store metrics in the database for historical tracking
+    Buffer metrics for historical tracking, writing them once the buffer is full
     """
-    try:
-        query = metrics_history_table.insert().values(
-            timestamp=datetime.now(),
-            cpu_percent=metrics["cpu"]["percent"],
-            memory_percent=metrics["memory"]["percent"],
-            disk_percent=metrics["disk"]["percent"]
-        )
-        await database.execute(query)
-    except Exception as e:
-        print(f"Error storing historical metrics: {str(e)}")
+    _metrics_buffer.append({
+        "timestamp": datetime.utcnow(),
+        "cpu_percent": metrics["cpu"]["percent"],
+        "memory_percent": metrics["memory"]["percent"],
+        "disk_percent": metrics["disk"]["percent"]
+    })
+    if len(_metrics_buffer) >= _BUFFER_MAX:
+        await flush_historical_metrics()
+
+async def flush_historical_metrics():
+    """
+    Write all buffered metrics to the database in one multi-row insert
+    """
+    async with _flush_lock:
+        if not _metrics_buffer:
+            return
+        rows = _metrics_buffer[:]
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(metrics_history_table.insert(), rows)
+                await session.commit()
+        except Exception as e:
+            print(f"Error storing historical metrics: {str(e)}")
+        finally:
+            # Rows stay readable from the buffer until the insert has finished;
+            # samples appended meanwhile sit after them and are kept
+            del _metrics_buffer[:len(rows)]
 
 # Background monitoring task
 async def check_system_health():
     """
     Continuous background task to monitor system health
     """
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
     while True:
         try:
             metrics = await get_system_metrics()
             
-            # Check CPU
-            if metrics["cpu"]["percent"] > CPU_THRESHOLD:
-                await create_alert("CPU", CPU_THRESHOLD, metrics["cpu"]["percent"])
-            
-            # Check Memory
-            if metrics["memory"]["percent"] > MEMORY_THRESHOLD:
-                await create_alert("Memory", MEMORY_THRESHOLD, metrics["memory"]["percent"])
-            
-            # Check Disk
-            if metrics["disk"]["percent"] > DISK_THRESHOLD:
-                await create_alert("Disk", DISK_THRESHOLD, metrics["disk"]["percent"])
+            # Raise alerts for every metric over its threshold concurrently
+            await asyncio.gather(*(
+                create_alert(name, threshold, metrics[key]["percent"])
+                for name, threshold, key in _CHECKS
+                if metrics[key]["percent"] > threshold
+            ))
             
             # Store historical metrics
             await store_historical_metrics(metrics)
@@ -294,7 +457,9 @@ async def check_system_health():
         except Exception as e:
             print(f"Error in health check: {str(e)}")
         
-        await asyncio.sleep(60)  # Check every minute
+        # Check every minute, measured from the previous tick so work time doesn't drift
+        next_tick = max(next_tick + 60, loop.time())
+        await asyncio.sleep(next_tick - loop.time())
 
 # API Endpoints
 @app.get("/")
@@ -328,22 +493,43 @@ async def get_metrics_history(
     """
     try:
         cutoff_time = datetime.utcnow() - timedelta(minutes=minutes)
-        query = metrics_history_table.select().where(
+        query = select(
+            metrics_history_table.c.timestamp,
+            metrics_history_table.c.cpu_percent,
+            metrics_history_table.c.memory_percent,
+            metrics_history_table.c.disk_percent
+        ).where(
             metrics_history_table.c.timestamp > cutoff_time
         ).order_by(metrics_history_table.c.timestamp.desc())
         
-        results = await database.fetch_all(query)
-        
-        formatted_results = []
-        for record in results:
-            formatted_results.append({
-                "timestamp": record.timestamp.isoformat(),
-                "cpu_percent": round(record.cpu_percent, 2),
-                "memory_percent": round(record.memory_percent, 2),
-                "disk_percent": round(record.disk_percent, 2)
-            })
+        # Samples not yet flushed are newer than anything in the table
+        pending = [
+            {
+                "timestamp": row["timestamp"],
+                "cpu_percent": round(row["cpu_percent"], 2),
+                "memory_percent": round(row["memory_percent"], 2),
+                "disk_percent": round(row["disk_percent"], 2)
+            }
+            for row in reversed(_metrics_buffer)
+            if row["timestamp"] > cutoff_time
+        ]
         
-        return formatted_results
+        async with AsyncSessionLocal() as session:
+            results = [
+                {
+                    "timestamp": record.timestamp,
+                    "cpu_percent": round(record.cpu_percent, 2),
+                    "memory_percent": round(record.memory_percent, 2),
+                    "disk_percent": round(record.disk_percent, 2)
+                }
+                for record in await session.execute(query)
+            ]
+        if results:
+            # A flush that finished during the query already returned these
+            pending = [row for row in pending if row["timestamp"] > results[0]["timestamp"]]
+        # Returning the response directly skips FastAPI's jsonable_encoder
+        # pass, so orjson serializes the rows (datetimes included) in C
+        return ORJSONResponse(pending + results)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -359,24 +545,16 @@ async def update_metadata(
     Create or update system metadata
     """
     try:
-        # Check if record exists
-        select_query = metadata_table.select().where(
-            metadata_table.c.name == metadata.name
+        # Insert, or update the existing record with the same name
+        query = upsert_insert(metadata_table).values(**metadata.dict())
+        query = query.on_conflict_do_update(
+            index_elements=[metadata_table.c.name],
+            set_=metadata.dict()
         )
-        existing = await database.fetch_one(select_query)
-        
-        if existing:
-            # Update existing record
-            query = metadata_table.update().where(
-                metadata_table.c.name == metadata.name
-            ).values(**metadata.dict())
-            await database.execute(query)
-            return {"message": "Metadata updated successfully"}
-        else:
-            # Insert new record
-            query = metadata_table.insert().values(**metadata.dict())
-            await database.execute(query)
-            return {"message": "Metadata created successfully"}
+        async with AsyncSessionLocal() as session:
+            await session.execute(query)
+            await session.commit()
+        return {"message": "Metadata saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating metadata: {str(e)}")
 
@@ -387,7 +565,9 @@ async def get_metadata(api_key: str = Depends(verify_api_key)):
     """
     try:
         query = metadata_table.select()
-        return await database.fetch_all(query)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            return [dict(row) for row in result.mappings()]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -401,8 +581,10 @@ async def delete_metadata(
     """
     try:
         query = metadata_table.delete().where(metadata_table.c.name == name)
-        result = await database.execute(query)
-        if result:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            await session.commit()
+        if result.rowcount:
             return {"message": f"Metadata for {name} deleted successfully"}
         raise HTTPException(status_code=404, detail="Metadata not found")
     except Exception as e:
@@ -420,13 +602,16 @@ async def get_alerts(
         query = alerts_table.select()
         if status:
             query = query.where(alerts_table.c.status == status)
-        return await database.fetch_all(query)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            return [dict(row) for row in result.mappings()]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/alerts/{alert_id}/resolve")
 async def resolve_alert(
     alert_id: int,
+    background_tasks: BackgroundTasks,
     api_key: str = Depends(verify_api_key)
 ):
     """
@@ -435,17 +620,13 @@ async def resolve_alert(
     try:
         query = alerts_table.update().where(
             alerts_table.c.id == alert_id
-        ).values(status="resolved")
-        result = await database.execute(query)
-        if result:
+        ).values(status="resolved").returning(*alerts_table.c)
+        async with AsyncSessionLocal() as session:
+            alert = (await session.execute(query)).first()
+            await session.commit()
+        if alert:
             # Send resolution notification to Slack
-            alert = await database.fetch_one(
-                alerts_table.select().where(alerts_table.c.id == alert_id)
-            )
-            if alert:
-                alert_dict = dict(alert)
-                alert_dict['status'] = 'resolved'
-                await send_slack_alert(alert_dict)
+            background_tasks.add_task(send_slack_alert, dict(alert._mapping))
             return {"message": f"Alert {alert_id} resolved"}
         raise HTTPException(status_code=404, detail="Alert not found")
     except Exception as e:
@@ -462,7 +643,7 @@ async def test_notification(api_key: str = Depends(verify_api_key)):
         "threshold": 80.0,
         "current_value": 85.0,
         "status": "active",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.utcnow()
     }
     await send_slack_alert(test_alert)
     return {"message": "Test notification sent"}
@@ -473,7 +654,8 @@ async def register_user(user: UserCreate):
     """Register a new user and return their API key"""
     # Check if user already exists
     query = users_table.select().where(users_table.c.email == user.email)
-    existing_user = await database.fetch_one(query)
+    async with AsyncSessionLocal() as session:
+        existing_user = (await session.execute(query)).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -482,11 +664,14 @@ async def register_user(user: UserCreate):
     query = users_table.insert().values(
         email=user.email,
         username=user.username,
-        password_hash=get_password_hash(user.password),
+        password_hash=await asyncio.to_thread(get_password_hash, user.password),
         api_key=api_key,
         created_at=datetime.utcnow()
     )
-    user_id = await database.execute(query)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        await session.commit()
+    user_id = result.inserted_primary_key[0]
     
     return {
         "id": user_id,
@@ -500,12 +685,13 @@ async def register_user(user: UserCreate):
 async def login_user(user: UserLogin):
     """Login user and return their API key"""
     query = users_table.select().where(users_table.c.email == user.email)
-    db_user = await database.fetch_one(query)
+    async with AsyncSessionLocal() as session:
+        db_user = (await session.execute(query)).first()
     
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(user.password, db_user.password_hash):
+    if not await asyncio.to_thread(verify_password, user.password, db_user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     return {"api_key": db_user.api_key}